@@ -1,4 +1,7 @@
+import math
 import re
+from collections import OrderedDict
+from decimal import Decimal
 
 import sublime
 import sublime_plugin
@@ -40,199 +43,350 @@ _CONVERT_DST_HEX_DFLT = '{0:#x}'
 # Default exponential destination format
 _CONVERT_DST_EXP_DFLT = r'e'
 # Default binary search pattern
-_CONVERT_SRC_BIN_DFLT = r'\b(?:0b)?([01]+)\b'
+_CONVERT_SRC_BIN_DFLT = r'(?:0b)?([01]+)'
 # Default hexadecimal search pattern
-_CONVERT_SRC_HEX_DFLT = r'\b(?:0x)?([0-9a-fA-F]+)h?\b'
+_CONVERT_SRC_HEX_DFLT = r'(?:0x)?([0-9a-fA-F]+)h?'
 # Default exponential search pattern
-_CONVERT_SRC_EXP_DFLT = r'\b(\d+\.\d+)e([-+]?\d+)\b'
+_CONVERT_SRC_EXP_DFLT = r'(\d+\.\d+)e([-+]?\d+)'
 # ============================================================================
 
 
-def load_pattern(view, name, default):
+def _char_table(chars):
+    table = bytearray(256)
+    for c in chars.encode('latin-1'):
+        table[c] = 1
+    return table
+
+
+# Lookup table of characters an exponential value may consist of
+_EXP_CHARS = _char_table('0123456789.eExX-')
+# Lookup table of characters a decimal value may consist of
+_DEC_CHARS = _char_table('0123456789.')
+# Precompiled default search patterns
+_DEFAULT_PATTERNS = {
+    'convert_src_bin': re.compile(_CONVERT_SRC_BIN_DFLT),
+    'convert_src_hex': re.compile(_CONVERT_SRC_HEX_DFLT),
+    'convert_src_exp': re.compile(_CONVERT_SRC_EXP_DFLT),
+}
+# Errors raised by converting a value due to invalid input or custom settings
+_CONVERT_ERRORS = (AttributeError, IndexError, KeyError, TypeError, ValueError)
+# Maximum number of compiled custom patterns to keep in the cache
+_PATTERN_CACHE_MAX = 32
+# Compiled custom patterns keyed by (setting name, pattern string)
+_PATTERN_CACHE = OrderedDict()
+
+
+def load_pattern(settings, name, default):
+    raw = settings.get(name)
+    if raw is None or raw == default or not isinstance(raw, str):
+        try:
+            return _DEFAULT_PATTERNS[name]
+        except KeyError:
+            raw = default
+
+    key = (name, raw)
     try:
-        return re.compile(view.settings().get(name, default))
-    except:
-        return re.compile(default)
+        return _PATTERN_CACHE[key]
+    except KeyError:
+        pass
 
+    try:
+        compiled = re.compile(raw)
+    except re.error:
+        compiled = _DEFAULT_PATTERNS.get(name) or re.compile(default)
 
-class BinToDecCommand(sublime_plugin.TextCommand):
+    # drop the oldest entry if the cache is full
+    if len(_PATTERN_CACHE) >= _PATTERN_CACHE_MAX:
+        _PATTERN_CACHE.popitem(last=False)
+    _PATTERN_CACHE[key] = compiled
+    return compiled
 
-    def run(self, edit):
-        num_skip = 0
-        view = self.view
-        r = load_pattern(view, 'convert_src_bin', _CONVERT_SRC_BIN_DFLT)
-        # convert all selected numbers
-        for sel in view.sel():
-            try:
-                # expand selection to word
-                if sel.empty():
-                    sel = view.word(sel)
-                    # if source is single quoted, expand selection
-                    # by one more character before and after the word.
-                    if r.pattern[0] == '\'':
-                        sel.a -= 1
-                        sel.b += 1
 
-                match = r.match(view.substr(sel))
-                view.replace(edit, sel, str(int(match.group(1), 2)))
+def fullmatch_fn(pattern):
+    """
+    Return a function matching pattern against a whole string.
 
-            except:
-                num_skip += 1
+    Python 3.3 (Sublime Text 3) doesn't provide ``fullmatch()`` yet,
+    so the pattern is anchored to the end of the string instead.
+    """
+    try:
+        return pattern.fullmatch
+    except AttributeError:
+        return re.compile(r'(?:%s)\Z' % pattern.pattern, pattern.flags).match
 
-        # show number of invalid values
-        if num_skip > 0:
-            sublime.status_message(
-                "Skipped %d invalid binary value(s)!" % num_skip)
 
+def _format_bin(value):
+    # same as '{0:b}'.format(value) without parsing the format spec
+    if value < 0:
+        return '-' + bin(value)[3:]
+    return bin(value)[2:]
 
-class BinToHexCommand(sublime_plugin.TextCommand):
 
-    def run(self, edit):
-        num_skip = 0
-        view = self.view
-        # read settings
-        dst_format = view.settings().get('convert_dst_hex', _CONVERT_DST_HEX_DFLT)
-        r = load_pattern(view, 'convert_src_bin', _CONVERT_SRC_BIN_DFLT)
-        # convert all selected numbers
-        for sel in view.sel():
-            try:
-                # expand selection to word
-                if sel.empty():
-                    sel = view.word(sel)
-                    # if source is single quoted, expand selection
-                    # by one more character before and after the word.
-                    if r.pattern[0] == '\'':
-                        sel.a -= 1
-                        sel.b += 1
+def _split_exp(value):
+    """
+    Split a float into the text of its mantissa and its decimal exponent.
 
-                match = r.match(view.substr(sel))
-                view.replace(edit, sel, dst_format.format(int(match.group(1), 2)))
+    The shortest representation of the value is split exactly, so values
+    just below a power of ten keep all their digits (999.9999999999999
+    -> 9.999999999999999, 2) instead of being rounded by scaling.
+    """
+    if not value:
+        return '0', 0
+    if math.isinf(value) or math.isnan(value):
+        raise ValueError('invalid value: %r' % value)
+    dec = Decimal(repr(value))
+    exp = dec.adjusted()
+    return str(dec.scaleb(-exp).normalize()), exp
 
-            except:
-                num_skip += 1
 
-        # show number of invalid values
-        if num_skip > 0:
-            sublime.status_message(
-                "Skipped %d invalid binary value(s)!" % num_skip)
+def _format_float(value):
+    # drop a trailing '.0' only, as rstrip('0').rstrip('.') would also
+    # cut exponents like 1e+20 to 1e+2
+    text = repr(value)
+    if text.endswith('.0'):
+        return text[:-2]
+    return text
 
 
-class DecToBinCommand(sublime_plugin.TextCommand):
+# Builtins producing the same output as the default destination formats
+_FAST_FORMATS = {
+    '{0}': str,
+    _CONVERT_DST_BIN_DFLT: _format_bin,
+    _CONVERT_DST_HEX_DFLT: hex,
+}
 
-    def run(self, edit):
-        num_skip = 0
-        view = self.view
-        # read settings
-        dst_format = view.settings().get('convert_dst_bin', _CONVERT_DST_BIN_DFLT)
-        # convert all selected numbers
-        for sel in view.sel():
-            try:
-                # expand selection to word
-                if sel.empty():
-                    sel = view.word(sel)
 
-                dec = view.substr(sel).strip()
-                view.replace(edit, sel, dst_format.format(int(dec)))
+def load_formatter(dst_format, default):
+    """
+    Return a function to format an integer by dst_format.
 
-            except:
-                num_skip += 1
+    Default formats are mapped to builtins to bypass ``str.format``.
+    The default is used if dst_format is not a string.
+    """
+    if not isinstance(dst_format, str):
+        dst_format = default
+    try:
+        return _FAST_FORMATS[dst_format]
+    except KeyError:
+        return dst_format.format
 
-        # show number of invalid values
-        if num_skip > 0:
-            sublime.status_message(
-                "Skipped %d invalid decimal value(s)!" % num_skip)
 
+def expand_region(view, region, chars):
+    """
+    Expand region to all adjacent characters marked in the chars table.
 
-class DecToHexCommand(sublime_plugin.TextCommand):
+    The line containing the region is fetched once and scanned locally
+    to avoid querying the view for each single character. It is encoded
+    to latin-1 with one byte per character, so each byte can directly
+    index the 256 entry lookup table.
+
+    Returns the expanded region and its text.
+    """
+    line = view.line(region)
+    text = view.substr(line)
+    data = text.encode('latin-1', 'replace')
+    size = len(data)
+    a = max(region.begin() - line.a, 0)
+    b = min(region.end() - line.a, size)
+    while a > 0 and chars[data[a - 1]]:
+        a -= 1
+    while b < size and chars[data[b]]:
+        b += 1
+    return sublime.Region(line.a + a, line.a + b), text[a:b]
+
+
+def show_skipped(num_skip, kind):
+    """
+    Show the number of skipped values of the given kind in the status bar.
+    """
+    sublime.status_message("Skipped %d invalid %s value(s)!" % (num_skip, kind))
+
+
+class _RegexConvertCommand(sublime_plugin.TextCommand):
+    """
+    Convert integers matched by a search pattern to another base.
+
+    Subclasses define the source pattern setting, the base of the matched
+    digits and the destination format setting.
+    """
+
+    # Name and default of the search pattern setting
+    SRC_SETTING = None
+    SRC_DEFAULT = None
+    # Base of the digits matched by the pattern's first group
+    SRC_BASE = 10
+    # Name and default of the destination format setting
+    DST_SETTING = None
+    DST_DEFAULT = '{0}'
+    # Kind of source values shown in the status message
+    KIND = ''
 
     def run(self, edit):
         num_skip = 0
         view = self.view
+        sels = view.sel()
+        if len(sels) == 0:
+            return
         # read settings
-        dst_format = view.settings().get('convert_dst_hex', _CONVERT_DST_HEX_DFLT)
-        # convert all selected numbers
-        for sel in view.sel():
-            try:
-                # expand selection to word
+        settings = view.settings()
+        if self.DST_SETTING:
+            dst_format = settings.get(self.DST_SETTING, self.DST_DEFAULT)
+        else:
+            dst_format = self.DST_DEFAULT
+        r = load_pattern(settings, self.SRC_SETTING, self.SRC_DEFAULT)
+        src_base = self.SRC_BASE
+        fmt = load_formatter(dst_format, self.DST_DEFAULT)
+        quoted = r.pattern[:1] == '\''
+        match_fn = fullmatch_fn(r)
+        substr = view.substr
+        replace = view.replace
+        word_fn = view.word
+        # convert all selected numbers from last to first to keep
+        # the offsets of preceding regions valid after each replacement
+        for i in range(len(sels) - 1, -1, -1):
+            sel = sels[i]
+            # expand selection to word
+            if sel.empty():
+                sel = word_fn(sel)
+                # skip carets not next to any word
                 if sel.empty():
-                    sel = view.word(sel)
-
-                dec = int(view.substr(sel).strip())
-                view.replace(edit, sel, dst_format.format(dec))
-
-            except:
+                    num_skip += 1
+                    continue
+                # if source is single quoted, expand selection
+                # by one more character before and after the word.
+                if quoted:
+                    sel.a -= 1
+                    sel.b += 1
+
+            # validate selection
+            text = substr(sel)
+            match = match_fn(text)
+            if match is None:
                 num_skip += 1
+                continue
+            try:
+                # int() parses digits in C, which is faster than any
+                # digit accumulation loop in Python, even for short values
+                result = fmt(int(match.group(1), src_base))
+            except _CONVERT_ERRORS:
+                num_skip += 1
+                continue
+            # replace selection with the result
+            replace(edit, sel, result)
 
         # show number of invalid values
-        if num_skip > 0:
-            sublime.status_message(
-                "Skipped %d invalid decimal value(s)!" % num_skip)
+        if num_skip:
+            show_skipped(num_skip, self.KIND)
+
+
+class BinToDecCommand(_RegexConvertCommand):
+    SRC_SETTING = 'convert_src_bin'
+    SRC_DEFAULT = _CONVERT_SRC_BIN_DFLT
+    SRC_BASE = 2
+    KIND = 'binary'
+
+
+class BinToHexCommand(_RegexConvertCommand):
+    SRC_SETTING = 'convert_src_bin'
+    SRC_DEFAULT = _CONVERT_SRC_BIN_DFLT
+    SRC_BASE = 2
+    DST_SETTING = 'convert_dst_hex'
+    DST_DEFAULT = _CONVERT_DST_HEX_DFLT
+    KIND = 'binary'
+
+
+class HexToBinCommand(_RegexConvertCommand):
+    SRC_SETTING = 'convert_src_hex'
+    SRC_DEFAULT = _CONVERT_SRC_HEX_DFLT
+    SRC_BASE = 16
+    DST_SETTING = 'convert_dst_bin'
+    DST_DEFAULT = _CONVERT_DST_BIN_DFLT
+    KIND = 'hexadecimal'
 
 
-class HexToBinCommand(sublime_plugin.TextCommand):
+class HexToDecCommand(_RegexConvertCommand):
+    SRC_SETTING = 'convert_src_hex'
+    SRC_DEFAULT = _CONVERT_SRC_HEX_DFLT
+    SRC_BASE = 16
+    KIND = 'hexadecimal'
+
+
+class DecToBinCommand(sublime_plugin.TextCommand):
 
     def run(self, edit):
         num_skip = 0
         view = self.view
+        sels = view.sel()
+        if len(sels) == 0:
+            return
         # read settings
         dst_format = view.settings().get('convert_dst_bin', _CONVERT_DST_BIN_DFLT)
-        r = load_pattern(view, 'convert_src_hex', _CONVERT_SRC_HEX_DFLT)
-        # convert all selected numbers
-        for sel in view.sel():
-            try:
-                # expand selection to word
+        fmt = load_formatter(dst_format, _CONVERT_DST_BIN_DFLT)
+        substr = view.substr
+        replace = view.replace
+        word_fn = view.word
+        # convert all selected numbers from last to first to keep
+        # the offsets of preceding regions valid after each replacement
+        for i in range(len(sels) - 1, -1, -1):
+            sel = sels[i]
+            # expand selection to word
+            if sel.empty():
+                sel = word_fn(sel)
+                # skip carets not next to any word
                 if sel.empty():
-                    sel = view.word(sel)
-                    # if source is single quoted, expand selection
-                    # by one more character before and after the word.
-                    if r.pattern[0] == '\'':
-                        sel.a -= 1
-                        sel.b += 1
-
-                # valid hex: 10 , 0x10 , 0x10h , 10h, h10
-                match = r.match(view.substr(sel))
-                view.replace(edit, sel, dst_format.format(int(match.group(1), 16)))
-
-            except:
+                    num_skip += 1
+                    continue
+
+            text = substr(sel)
+            try:
+                result = fmt(int(text.strip()))
+            except _CONVERT_ERRORS:
                 num_skip += 1
+                continue
+            replace(edit, sel, result)
 
         # show number of invalid values
-        if num_skip > 0:
-            sublime.status_message(
-                "Skipped %d invalid hexadecimal value(s)!" % num_skip)
+        if num_skip:
+            show_skipped(num_skip, 'decimal')
 
 
-class HexToDecCommand(sublime_plugin.TextCommand):
+class DecToHexCommand(sublime_plugin.TextCommand):
 
     def run(self, edit):
         num_skip = 0
         view = self.view
+        sels = view.sel()
+        if len(sels) == 0:
+            return
         # read settings
-        r = load_pattern(view, 'convert_src_hex', _CONVERT_SRC_HEX_DFLT)
-        # convert all selected numbers
-        for sel in view.sel():
-            try:
-                # expand selection to word
+        dst_format = view.settings().get('convert_dst_hex', _CONVERT_DST_HEX_DFLT)
+        fmt = load_formatter(dst_format, _CONVERT_DST_HEX_DFLT)
+        substr = view.substr
+        replace = view.replace
+        word_fn = view.word
+        # convert all selected numbers from last to first to keep
+        # the offsets of preceding regions valid after each replacement
+        for i in range(len(sels) - 1, -1, -1):
+            sel = sels[i]
+            # expand selection to word
+            if sel.empty():
+                sel = word_fn(sel)
+                # skip carets not next to any word
                 if sel.empty():
-                    sel = view.word(sel)
-                    # if source is single quoted, expand selection
-                    # by one more character before and after the word.
-                    if r.pattern[0] == '\'':
-                        sel.a -= 1
-                        sel.b += 1
-
-                # validate selection
-                match = r.match(view.substr(sel))
-                # replace selection with the result
-                view.replace(edit, sel, str(int(match.group(1), 16)))
-
-            except:
+                    num_skip += 1
+                    continue
+
+            text = substr(sel)
+            try:
+                result = fmt(int(text.strip()))
+            except _CONVERT_ERRORS:
                 num_skip += 1
+                continue
+            replace(edit, sel, result)
 
         # show number of invalid values
-        if num_skip > 0:
-            sublime.status_message(
-                "Skipped %d invalid hexadecimal value(s)!" % num_skip)
+        if num_skip:
+            show_skipped(num_skip, 'decimal')
 
 
 class ExpToDecCommand(sublime_plugin.TextCommand):
@@ -249,33 +403,51 @@ class ExpToDecCommand(sublime_plugin.TextCommand):
     def run(self, edit):
         num_skip = 0
         view = self.view
+        sels = view.sel()
+        if len(sels) == 0:
+            return
         # read settings
-        r = load_pattern(view, 'convert_src_exp', _CONVERT_SRC_EXP_DFLT)
-        # convert all selected numbers
-        for sel in view.sel():
-            try:
-                # expand selection to word
+        r = load_pattern(view.settings(), 'convert_src_exp', _CONVERT_SRC_EXP_DFLT)
+        match_fn = fullmatch_fn(r)
+        substr = view.substr
+        replace = view.replace
+        word_fn = view.word
+        # convert all selected numbers from last to first to keep
+        # the offsets of preceding regions valid after each replacement
+        for i in range(len(sels) - 1, -1, -1):
+            sel = sels[i]
+            # expand selection to word
+            if sel.empty():
+                sel, text = expand_region(view, word_fn(sel), _EXP_CHARS)
+                # skip carets not next to any word
                 if sel.empty():
-                    sel = view.word(sel)
-                    while view.substr(sel.a - 1) in "0123456789.eExX-":
-                        sel.a -= 1
-                    while view.substr(sel.b) in "0123456789.eExX-":
-                        sel.b += 1
-
-                # validate selection
-                match = r.match(view.substr(sel))
-                # convert the match and round by 18 digits after comma
-                result = round(float(match.group(1)) * 10 ** float(match.group(2)), 18)
-                # replace selection with the formated result
-                view.replace(edit, sel, str(result).rstrip('0').rstrip('.'))
-
-            except:
+                    num_skip += 1
+                    continue
+            else:
+                text = substr(sel)
+
+            # validate selection
+            match = match_fn(text)
+            if match is None:
+                num_skip += 1
+                continue
+            try:
+                # let float() scale the mantissa by the exponent exactly
+                # and round the result by 18 digits after comma
+                result = round(float(
+                    match.group(1) + 'e' + str(int(match.group(2)))), 18)
+            except (IndexError, OverflowError, TypeError, ValueError):
+                num_skip += 1
+                continue
+            if math.isinf(result):
                 num_skip += 1
+                continue
+            # replace selection with the formated result
+            replace(edit, sel, _format_float(result))
 
         # show number of invalid values
-        if num_skip > 0:
-            sublime.status_message(
-                "Skipped %d invalid exponential value(s)!" % num_skip)
+        if num_skip:
+            show_skipped(num_skip, 'exponential')
 
 
 class DecToExpCommand(sublime_plugin.TextCommand):
@@ -292,38 +464,40 @@ class DecToExpCommand(sublime_plugin.TextCommand):
     def run(self, edit):
         num_skip = 0
         view = self.view
+        sels = view.sel()
+        if len(sels) == 0:
+            return
         # read settings
         dst_pattern = view.settings().get('convert_dst_exp', _CONVERT_DST_EXP_DFLT)
-        # convert all selected numbers
-        for sel in view.sel():
-            try:
-                # expand selection to word
+        if not isinstance(dst_pattern, str):
+            dst_pattern = _CONVERT_DST_EXP_DFLT
+        substr = view.substr
+        replace = view.replace
+        word_fn = view.word
+        # convert all selected numbers from last to first to keep
+        # the offsets of preceding regions valid after each replacement
+        for i in range(len(sels) - 1, -1, -1):
+            sel = sels[i]
+            # expand selection to word
+            if sel.empty():
+                sel, text = expand_region(view, word_fn(sel), _DEC_CHARS)
+                # skip carets not next to any word
                 if sel.empty():
-                    sel = view.word(sel)
-                    while view.substr(sel.a - 1) in "0123456789.":
-                        sel.a -= 1
-                    while view.substr(sel.b) in "0123456789.":
-                        sel.b += 1
-
-                # convert the value
-                base = float(view.substr(sel))
-                exp = 0
-                while base > 10:
-                    base /= 10
-                    exp += 1
-                while base < 1:
-                    base *= 10
-                    exp -= 1
-
-                # convert base to string
-                base = str(base).rstrip('0').rstrip('.')
-                # replace selection with the formated result
-                view.replace(edit, sel, base + dst_pattern + str(exp))
-
-            except:
+                    num_skip += 1
+                    continue
+            else:
+                text = substr(sel)
+
+            # convert the value
+            try:
+                base, exp = _split_exp(float(text))
+            except (OverflowError, ValueError):
                 num_skip += 1
+                continue
+
+            # replace selection with the formated result
+            replace(edit, sel, base + dst_pattern + str(exp))
 
         # show number of invalid values
-        if num_skip > 0:
-            sublime.status_message(
-                "Skipped %d invalid decimal value(s)!" % num_skip)
+        if num_skip:
+            show_skipped(num_skip, 'decimal')